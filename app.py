@@ -1,48 +1,150 @@
-from flask import Flask, request, jsonify
+from quart import Quart, request, jsonify
 import os
+import logging
+import tempfile
+import queue
+import asyncio
+import threading
+import hashlib
+import functools
 import easyocr
+import torch
+import numpy as np
 import re
+from concurrent.futures import ThreadPoolExecutor
 import google.generativeai as genai
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
+from PIL import Image
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
-from flask_cors import CORS
-from spellchecker import SpellChecker
+from quart_cors import cors
+from symspellpy import SymSpell, Verbosity
+from importlib.resources import files as package_files
+from diskcache import Cache
 
 # -------------------------
 # LOAD ENVIRONMENT VARIABLES
 # -------------------------
 load_dotenv()
 
-app = Flask(__name__)
-CORS(app, origins=["http://localhost:8080", "http://127.0.0.1:8080"])
+# -------------------------
+# LOGGING
+# -------------------------
+# Defaults to WARNING so per-request progress messages cost nothing in
+# production; set LOG_LEVEL=INFO or DEBUG to see them
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "WARNING").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+log = logging.getLogger("medical_extractor")
+
+app = Quart(__name__)
+app = cors(app, allow_origin=["http://localhost:8080", "http://127.0.0.1:8080"])
 
 # Load keys
 API_KEY = os.getenv("API_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-# Uploads folder
-UPLOAD_FOLDER = "uploads"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Uploads are kept in a per-request temporary directory; cap the request
+# size so a single upload can't exhaust the disk
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "50"))
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_MB * 1024 * 1024
+
+# OCR and Gemini run while the response streams, which on a CPU host
+# easily outlasts Quart's default 60 s body timeout
+app.config["RESPONSE_TIMEOUT"] = None
 
 # Configure Gemini
 genai.configure(api_key=GEMINI_API_KEY)
 
-# Initialize EasyOCR
-reader = easyocr.Reader(['en'], gpu=False)
+# Gemini responses are cached by report content; bump CACHE_VERSION
+# whenever a prompt changes so stale answers are never served.
+# The cache is a SQLite-backed directory on local disk, relative to the
+# working directory unless GEMINI_CACHE_FOLDER says otherwise. Entries
+# hold patient summaries in plain text, so keep the folder private and
+# let them expire after GEMINI_CACHE_TTL seconds (default one day).
+CACHE_VERSION = "v2"
+GEMINI_CACHE_FOLDER = os.getenv("GEMINI_CACHE_FOLDER", "gemini_cache")
+GEMINI_CACHE_TTL = int(os.getenv("GEMINI_CACHE_TTL", str(24 * 60 * 60)))
+gemini_cache = Cache(GEMINI_CACHE_FOLDER)
+# Drop the SQLite connection opened during setup so that forked workers
+# (gunicorn --preload) each reconnect instead of sharing it
+gemini_cache.close()
+
+# Pages are padded to a fixed size so they can be batched through the
+# detector in a single forward pass
+OCR_PAGE_WIDTH = 1280
+OCR_PAGE_HEIGHT = 1760
+OCR_BATCH_SIZE = 8
+
+# 150 dpi renders an A4 page at roughly the OCR page size above
+PDF_DPI = 150
+
+# Run EasyOCR on the GPU when CUDA is available. The NVML-based check
+# answers without initialising CUDA, so the preloading master stays
+# safe to fork.
+os.environ.setdefault("PYTORCH_NVML_BASED_CUDA_CHECK", "1")
+USE_GPU = torch.cuda.is_available()
+log.info("🔧 EasyOCR running on %s.", "GPU" if USE_GPU else "CPU")
+
+_reader = None
+_reader_lock = threading.Lock()
+
+
+def _load_reader():
+    ocr_reader = easyocr.Reader(['en'], gpu=USE_GPU, cudnn_benchmark=USE_GPU)
+    # Warm up once so the first request doesn't pay for cuDNN
+    # autotuning; on the CPU there is nothing to tune
+    if USE_GPU:
+        ocr_reader.readtext_batched(
+            np.zeros([OCR_BATCH_SIZE, OCR_PAGE_HEIGHT, OCR_PAGE_WIDTH, 3], dtype=np.uint8),
+            n_width=OCR_PAGE_WIDTH,
+            n_height=OCR_PAGE_HEIGHT,
+            batch_size=OCR_BATCH_SIZE,
+        )
+    return ocr_reader
+
+
+def get_reader():
+    global _reader
+    if _reader is None:
+        with _reader_lock:
+            if _reader is None:
+                _reader = _load_reader()
+    return _reader
+
+
+# On the CPU, load the models now so gunicorn --preload workers share
+# them copy-on-write. CUDA can't be used across fork, so on the GPU each
+# worker builds its own Reader on first use instead.
+if not USE_GPU:
+    get_reader()
+
+# EasyOCR calls allowed at once across the whole process, not per
+# request, to avoid CPU/VRAM contention between concurrent requests
+OCR_SLOTS = int(os.getenv("OCR_CONCURRENCY", "2"))
+ocr_slots = threading.Semaphore(OCR_SLOTS)
+
+# Files being extracted at once across the whole process: one per OCR
+# slot plus one rasterizing behind it. Extraction runs here rather than
+# on the event loop's default executor, so requests never compete with
+# it for threads.
+extraction_executor = ThreadPoolExecutor(
+    max_workers=OCR_SLOTS * 2, thread_name_prefix="extract"
+)
 
 
 # -------------------------
 # API KEY AUTH DECORATOR
 # -------------------------
 def require_api_key(f):
-    def decorated_function(*args, **kwargs):
+    async def decorated_function(*args, **kwargs):
         client_key = request.headers.get("X-API-Key")
         if client_key != API_KEY:
-            print("❌ Invalid or missing API key!")
+            log.warning("❌ Invalid or missing API key!")
             return jsonify({"error": "Unauthorized - Invalid API key"}), 401
-        print("✅ API key authenticated successfully.")
-        return f(*args, **kwargs)
+        log.debug("✅ API key authenticated successfully.")
+        return await f(*args, **kwargs)
     decorated_function.__name__ = f.__name__
     return decorated_function
 
@@ -50,85 +152,249 @@ def require_api_key(f):
 # -------------------------
 # CLEAN TEXT FUNCTION
 # -------------------------
+WHITESPACE_PATTERN = re.compile(r'\s+')
+DISALLOWED_CHARS_PATTERN = re.compile(r'[^A-Za-z0-9%:.,/\\\- ()]+')
+
+
 def clean_text(raw_text):
-    print("🧹 Cleaning extracted text...")
-    text = re.sub(r'\s+', ' ', raw_text)
-    text = re.sub(r'[^A-Za-z0-9%:.,/\\\- ()]+', '', text)
+    log.debug("🧹 Cleaning extracted text...")
+    text = WHITESPACE_PATTERN.sub(' ', raw_text)
+    text = DISALLOWED_CHARS_PATTERN.sub('', text)
     return text.strip()
 
 
 # -------------------------
 # SPELLCHECK FUNCTION
 # -------------------------
+# Off by default: Gemini copes with OCR noise on its own, while a generic
+# English dictionary tends to "fix" drug names and lab codes
+ENABLE_SPELLCHECK = os.getenv("ENABLE_SPELLCHECK", "0") == "1"
+
+# SymSpell precomputes a deletion index over the frequency dictionary,
+# so each lookup is a hash probe instead of an edit-distance search.
+# Building the index is slow, so it happens once at startup.
+SPELL_MAX_EDIT_DISTANCE = 2
+SPELL_DICTIONARY = package_files("symspellpy") / "frequency_dictionary_en_82_765.txt"
+
+spell = None
+if ENABLE_SPELLCHECK:
+    spell = SymSpell(max_dictionary_edit_distance=SPELL_MAX_EDIT_DISTANCE)
+    spell.load_dictionary(str(SPELL_DICTIONARY), term_index=0, count_index=1)
+
+
+def _correct_word(word):
+    suggestions = spell.lookup(
+        word,
+        Verbosity.CLOSEST,
+        max_edit_distance=SPELL_MAX_EDIT_DISTANCE,
+        include_unknown=True,
+        transfer_casing=True,
+    )
+    return suggestions[0].term if suggestions else word
+
+
 def correct_spelling(text):
-    print("🔠 Correcting OCR spelling mistakes...")
-    spell = SpellChecker()
+    log.debug("🔠 Correcting OCR spelling mistakes...")
     words = text.split()
-    corrected = []
-    for w in words:
-        if w.isalpha():
-            corrected.append(spell.correction(w) or w)
-        else:
-            corrected.append(w)
-    return " ".join(corrected)
+    fixes = {w: _correct_word(w) for w in set(words) if w.isalpha()}
+    return " ".join(fixes.get(w, w) for w in words)
 
 
 # -------------------------
-# OCR EXTRACTION FUNCTION
+# OCR EXTRACTION FUNCTIONS
 # -------------------------
-def extract_text_from_file(file_path):
-    print(f"📄 Extracting text from: {file_path}")
+def _fit_page(page):
+    # Shrink the page to fit the OCR page size, keeping its aspect ratio,
+    # and pad the rest with white. readtext_batched would otherwise stretch
+    # every page to that size, squashing landscape pages and odd formats.
+    page = page.convert("RGB")
+    page.thumbnail((OCR_PAGE_WIDTH, OCR_PAGE_HEIGHT))
+    canvas = Image.new("RGB", (OCR_PAGE_WIDTH, OCR_PAGE_HEIGHT), "white")
+    canvas.paste(page, (0, 0))
+    return np.asarray(canvas)
+
+
+def iter_page_batches(file_path):
+    # Render one OCR batch worth of pages at a time rather than the whole
+    # document, so only a window of pages is ever held in memory
+    page_count = pdfinfo_from_path(file_path)["Pages"]
+    for first_page in range(1, page_count + 1, OCR_BATCH_SIZE):
+        last_page = min(first_page + OCR_BATCH_SIZE - 1, page_count)
+        log.debug("🖼️ Rasterizing pages %d-%d of %s", first_page, last_page, file_path)
+        pages = convert_from_path(
+            file_path,
+            dpi=PDF_DPI,
+            first_page=first_page,
+            last_page=last_page,
+            thread_count=os.cpu_count(),
+        )
+        yield [_fit_page(page) for page in pages]
+
+
+def _prefetch(iterable):
+    # Pull the next item on a background thread while the caller is busy
+    # with the current one (e.g. rasterize batch i+1 during OCR of batch i).
+    # The producer waits for each item to be taken before making the next,
+    # so at most two exist at once: the caller's and the one ready behind it.
+    buffer = queue.Queue()
+    taken = threading.Semaphore(0)
+    stop = threading.Event()
+    finished = object()
+
+    def produce():
+        try:
+            for item in iterable:
+                buffer.put(item)
+                taken.acquire()
+                if stop.is_set():
+                    return
+            buffer.put(finished)
+        except Exception as e:
+            buffer.put(e)
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is finished:
+                return
+            if isinstance(item, Exception):
+                raise item
+            taken.release()
+            yield item
+    finally:
+        # Stop the producer if the caller gave up early
+        stop.set()
+        taken.release()
+
+
+def ocr_pages(pages):
+    with ocr_slots:
+        results = get_reader().readtext_batched(
+            pages,
+            n_width=OCR_PAGE_WIDTH,
+            n_height=OCR_PAGE_HEIGHT,
+            batch_size=OCR_BATCH_SIZE,
+            detail=0,
+        )
+    return ["\n".join(result) for result in results]
+
+
+def extract_text_from_file(file_path, stop=None):
+    log.info("📄 Extracting text from: %s", file_path)
     ext = os.path.splitext(file_path)[1].lower()
-    text = ""
     if ext == ".pdf":
-        pages = convert_from_path(file_path)
-        for i, page in enumerate(pages):
-            temp_img = os.path.join(UPLOAD_FOLDER, f"page_{i}.jpg")
-            page.save(temp_img, "JPEG")
-            result = reader.readtext(temp_img, detail=0)
-            text += "\n".join(result)
+        for pages in _prefetch(iter_page_batches(file_path)):
+            if stop is not None and stop.is_set():
+                log.info("🛑 Extraction cancelled: %s", file_path)
+                return
+            yield from ocr_pages(pages)
     else:
-        result = reader.readtext(file_path, detail=0)
-        text = "\n".join(result)
-    print("✅ OCR extraction completed.")
-    return text
+        # A single image gains nothing from batching, and resizing it to
+        # the fixed PDF page size would distort it
+        with ocr_slots:
+            result = get_reader().readtext(file_path, detail=0)
+        yield "\n".join(result)
+    log.info("✅ OCR extraction completed.")
 
 
 # -------------------------
 # SMART NUMERIC HIGHLIGHT
 # -------------------------
-def highlight_abnormal_values(text):
-    print("📊 Checking numeric reference values...")
-    pattern = r"([A-Za-z\s]+)\s+([\d.]+)\s*[a-zA-Z/%^]*\s*\(([\d.]+)\s*-\s*([\d.]+)\)"
-    highlighted_text = text
+LAB_VALUE_PATTERN = re.compile(
+    r"([A-Za-z\s]+)\s+([\d.]+)\s*[a-zA-Z/%^]*\s*\(([\d.]+)\s*-\s*([\d.]+)\)"
+)
 
-    for match in re.finditer(pattern, text):
-        test_name, value, ref_min, ref_max = match.groups()
-        try:
-            value = float(value)
-            ref_min = float(ref_min)
-            ref_max = float(ref_max)
 
-            if value < ref_min or value > ref_max:
-                replacement = f"<span style='color:red; font-weight:bold;'>{match.group(0)}</span>"
-            else:
-                replacement = f"<span style='color:green; font-weight:bold;'>{match.group(0)}</span>"
+def _lab_value_span(match, abnormal):
+    color = "red" if abnormal else "green"
+    return f"<span style='color:{color}; font-weight:bold;'>{match.group(0)}</span>"
+
 
-            highlighted_text = highlighted_text.replace(match.group(0), replacement)
+def highlight_abnormal_values(text):
+    log.debug("📊 Checking numeric reference values...")
+    matches = []
+    readings = []
+    for match in LAB_VALUE_PATTERN.finditer(text):
+        try:
+            readings.append([float(g) for g in match.group(2, 3, 4)])
         except ValueError:
             continue
+        matches.append(match)
+
+    if not matches:
+        return text
+
+    # Compare every (value, ref_min, ref_max) row in one vectorized step
+    readings = np.array(readings)
+    abnormal = (readings[:, 0] < readings[:, 1]) | (readings[:, 0] > readings[:, 2])
+
+    # Stitch the text back together, wrapping each match exactly once
+    parts = []
+    position = 0
+    for match, is_abnormal in zip(matches, abnormal):
+        parts.append(text[position:match.start()])
+        parts.append(_lab_value_span(match, is_abnormal))
+        position = match.end()
+    parts.append(text[position:])
+    return "".join(parts)
+
+
+# -------------------------
+# GEMINI RESPONSE CACHE
+# -------------------------
+def content_cache_key(name, text):
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{CACHE_VERSION}:{name}:{digest}"
+
+
+# diskcache does blocking SQLite and file I/O, so it runs off the event loop
+async def cache_get(name, text):
+    cached = await asyncio.to_thread(gemini_cache.get, content_cache_key(name, text))
+    if cached is not None:
+        log.info("♻️ Using cached Gemini response.")
+    return cached
+
+
+async def cache_set(name, text, result):
+    # Empty answers are not cached so a transient failure is retried
+    if result:
+        await asyncio.to_thread(
+            gemini_cache.set, content_cache_key(name, text), result, expire=GEMINI_CACHE_TTL
+        )
+
+
+def cache_by_content(f):
+    @functools.wraps(f)
+    async def decorated_function(text):
+        cached = await cache_get(f.__name__, text)
+        if cached is not None:
+            return cached
+        result = await f(text)
+        await cache_set(f.__name__, text, result)
+        return result
+    return decorated_function
 
-    return highlighted_text
+
+def response_text(response):
+    # .text raises ValueError rather than AttributeError when a response
+    # or stream chunk has no text part, e.g. when it was blocked
+    try:
+        return response.text
+    except (AttributeError, ValueError):
+        return ""
 
 
 # -------------------------
 # GEMINI SEVERITY CLASSIFIER
 # -------------------------
-def classify_severity(summary_text):
-    print("🩺 Classifying severity level using Gemini...")
+@cache_by_content
+async def request_severity(cleaned_text):
     prompt = f"""
     You are a medical text reviewer.
-    Read the following medical summary carefully and determine the case severity.
+    Read the following medical report carefully and determine the case severity.
+    The report was extracted with OCR and may contain misspellings or
+    broken words; interpret them by context.
 
     Choose only one of:
     A - Abnormal (serious findings or abnormal values)
@@ -137,15 +403,20 @@ def classify_severity(summary_text):
 
     Respond with only the letter (A, B, or C).
 
-    SUMMARY:
-    {summary_text}
+    MEDICAL REPORT:
+    {cleaned_text}
     """
 
     model = genai.GenerativeModel("gemini-2.5-flash")
+    response = await model.generate_content_async(prompt)
+    return response_text(response).strip()
+
+
+async def classify_severity(cleaned_text):
+    log.debug("🩺 Classifying severity level using Gemini...")
     try:
-        response = model.generate_content(prompt)
-        classification = getattr(response, "text", "").strip().upper()
-        print(f"🔍 Gemini classification result: {classification}")
+        classification = (await request_severity(cleaned_text)).upper()
+        log.info("🔍 Gemini classification result: %s", classification)
         if "A" in classification:
             return "A"
         elif "B" in classification:
@@ -153,16 +424,14 @@ def classify_severity(summary_text):
         else:
             return "C"
     except Exception as e:
-        print(f"⚠️ Gemini classification error: {e}")
+        log.warning("⚠️ Gemini classification error: %s", e)
         return "C"
 
 
 # -------------------------
 # GEMINI SUMMARY FUNCTION
 # -------------------------
-def summarize_medical_report(cleaned_text, doc_name=None):
-    print("🧠 Generating medical summary dynamically using Gemini...")
-
+def summary_prompt(cleaned_text):
     greeting = "Hello,"
 
     prompt = f"""
@@ -174,6 +443,8 @@ def summarize_medical_report(cleaned_text, doc_name=None):
       <span style='color:red; font-weight:bold;'>...</span>
     - Identify reassuring or normal findings and wrap them with:
       <span style='color:green; font-weight:bold;'>...</span>
+    - The report was extracted with OCR and may contain misspellings or
+      broken words; silently correct them from context.
     - Preserve medical accuracy, do NOT guess data.
     - Respect numeric reference ranges shown in the text.
     - Keep tone professional and clear.
@@ -192,97 +463,253 @@ def summarize_medical_report(cleaned_text, doc_name=None):
     MEDICAL REPORT:
     {cleaned_text}
     """
+    return prompt
+
+
+async def request_summary(cleaned_text):
+    # Streams the summary as Gemini produces it; a complete answer is
+    # cached like the other Gemini calls and replayed in one chunk
+    cached = await cache_get("request_summary", cleaned_text)
+    if cached is not None:
+        yield cached
+        return
 
     model = genai.GenerativeModel("gemini-2.5-flash")
-    try:
-        response = model.generate_content(prompt)
-        summary = getattr(response, "text", "").strip()
-    except Exception as e:
-        print(f"❌ Gemini API error: {e}")
-        summary = "⚠️ Could not generate summary."
+    response = await model.generate_content_async(summary_prompt(cleaned_text), stream=True)
+    chunks = []
+    async for chunk in response:
+        text = response_text(chunk)
+        if text:
+            chunks.append(text)
+            yield text
 
-    # Highlight numeric abnormalities
-    summary = highlight_abnormal_values(summary)
+    await cache_set("request_summary", cleaned_text, "".join(chunks).strip())
 
-    # Classify the report
-    severity = classify_severity(summary)
 
-    # Append human-readable message with explanation
-    if severity == "A":
-        summary += (
-            "<br><br>⚠️ <b>Some findings require follow-up with your doctor.</b> "
-            "These results indicate notable abnormalities or tissue pattern changes "
-            "that may need further medical evaluation to rule out potential risks."
-        )
-    elif severity == "B":
-        summary += (
-            "<br><br>🟡 <b>Mild variations observed.</b> "
-            "Some readings are slightly outside normal limits, "
-            "but they typically do not indicate serious problems. "
-            "Monitoring and lifestyle adjustments may be advised."
-        )
-    else:
-        summary += (
-            "<br><br>✅ <b>All parameters appear within normal limits.</b> "
-            "No major concerns detected in this report."
-        )
+async def generate_summary(cleaned_text):
+    log.debug("🧠 Generating medical summary dynamically using Gemini...")
+    streamed = False
+    try:
+        async for chunk in request_summary(cleaned_text):
+            streamed = True
+            yield chunk
+        if not streamed:
+            # Every chunk was empty, e.g. the response was blocked
+            yield "⚠️ Could not generate summary."
+    except Exception as e:
+        log.error("❌ Gemini API error: %s", e)
+        if streamed:
+            # Make a cut-off summary visibly incomplete
+            yield "\n⚠️ Summary interrupted."
+        else:
+            yield "⚠️ Could not generate summary."
+
+
+SEVERITY_MESSAGES = {
+    "A": (
+        "<br><br>⚠️ <b>Some findings require follow-up with your doctor.</b> "
+        "These results indicate notable abnormalities or tissue pattern changes "
+        "that may need further medical evaluation to rule out potential risks."
+    ),
+    "B": (
+        "<br><br>🟡 <b>Mild variations observed.</b> "
+        "Some readings are slightly outside normal limits, "
+        "but they typically do not indicate serious problems. "
+        "Monitoring and lifestyle adjustments may be advised."
+    ),
+    "C": (
+        "<br><br>✅ <b>All parameters appear within normal limits.</b> "
+        "No major concerns detected in this report."
+    ),
+}
+
+
+async def summarize_medical_report(cleaned_text):
+    # Severity reads the report itself, so it runs while the summary streams
+    severity = asyncio.ensure_future(classify_severity(cleaned_text))
+    try:
+        # Highlight numeric abnormalities line by line as the summary arrives
+        buffer = ""
+        async for chunk in generate_summary(cleaned_text):
+            buffer += chunk
+            while "\n" in buffer:
+                line, buffer = buffer.split("\n", 1)
+                yield highlight_abnormal_values(line)
+        if buffer:
+            yield highlight_abnormal_values(buffer)
+    except BaseException:
+        # Don't leave the Gemini call running if the summary was abandoned
+        severity.cancel()
+        raise
 
-    print(f"✅ Summary generated ({severity} case).")
-    return summary
+    # Append human-readable message with explanation
+    severity = await severity
+    yield SEVERITY_MESSAGES[severity]
+    log.info("✅ Summary generated (%s case).", severity)
 
 
 # -------------------------
-# MAIN API ROUTE
+# DOCUMENT TYPE DETECTION
 # -------------------------
-@app.route("/api/testing", methods=["POST"])
-@require_api_key
-def process_documents():
-    print("📩 Received document processing request...")
+DOCUMENT_TYPE_PATTERN = re.compile(
+    r"(histopathology|endometrial polyp|cytology|\bpap\b|haematology|blood count)",
+    re.IGNORECASE,
+)
+DOCUMENT_TYPES = {
+    "histopathology": "Histopathology Report",
+    "endometrial polyp": "Histopathology Report",
+    "cytology": "PAP Test Report",
+    "pap": "PAP Test Report",
+    "haematology": "Blood Test Report",
+    "blood count": "Blood Test Report",
+}
+# When a report mentions several keywords, the earlier type wins
+DOCUMENT_TYPE_PRIORITY = ["Histopathology Report", "PAP Test Report", "Blood Test Report"]
+
+
+def detect_document_type(cleaned_text):
+    found = set()
+    for match in DOCUMENT_TYPE_PATTERN.finditer(cleaned_text):
+        doc_name = DOCUMENT_TYPES[match.group(1).lower()]
+        if doc_name == DOCUMENT_TYPE_PRIORITY[0]:
+            return doc_name
+        found.add(doc_name)
+
+    for doc_name in DOCUMENT_TYPE_PRIORITY:
+        if doc_name in found:
+            return doc_name
+    return "General Medical Report"
 
-    if "file" not in request.files:
-        return jsonify({"error": "No file uploaded!"}), 400
 
-    files = request.files.getlist("file")
-    results = []
+# -------------------------
+# PROCESSING PIPELINE
+# -------------------------
+# Each file is extracted (pdf2image + EasyOCR + cleanup) on a shared,
+# bounded thread pool, and its Gemini summary starts as soon as its text
+# is ready, so OCR of the next file overlaps the Gemini round-trip of the
+# previous one. Within a file, rasterization runs one page batch ahead of
+# OCR. Summaries stream into per-file asyncio queues, which the response
+# drains in upload order; None marks the end of a file.
+def prepare_text(file_path, stop):
+    # The request may have gone away while this file waited for a worker
+    if stop.is_set():
+        return ""
+    cleaned = clean_text("\n".join(extract_text_from_file(file_path, stop)))
+    if ENABLE_SPELLCHECK:
+        cleaned = correct_spelling(cleaned)
+    return cleaned
 
-    for file in files:
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(file_path)
-        print(f"⚙️ Processing file: {filename}")
 
-        raw_text = extract_text_from_file(file_path)
-        cleaned = clean_text(raw_text)
-        cleaned = correct_spelling(cleaned)
+async def summarize_document(cleaned_text, outbox):
+    try:
+        async for fragment in summarize_medical_report(cleaned_text):
+            await outbox.put(fragment)
+    finally:
+        await outbox.put(None)
 
-        lowered = cleaned.lower()
-        if "histopathology" in lowered or "endometrial polyp" in lowered:
-            doc_name = "Histopathology Report"
-        elif "cytology" in lowered or "pap" in lowered:
-            doc_name = "PAP Test Report"
-        elif "haematology" in lowered or "blood count" in lowered:
-            doc_name = "Blood Test Report"
-        else:
-            doc_name = "General Medical Report"
 
-        summary = summarize_medical_report(cleaned, doc_name)
+async def _drain(outbox):
+    while (fragment := await outbox.get()) is not None:
+        yield fragment
 
-        results.append({
-            "filename": filename,
-            "document_type": doc_name,
-            "summary": summary
-        })
 
-    print("✅ All files processed successfully.")
-    combined_output = "\n\n=========================\n\n".join(
-        [f"📄 {r['filename']} ({r['document_type']})\n\n{r['summary']}" for r in results]
+async def extract_document(file_path, stop, summaries):
+    loop = asyncio.get_running_loop()
+    cleaned_text = await loop.run_in_executor(
+        extraction_executor, prepare_text, file_path, stop
     )
+    outbox = asyncio.Queue()
+    summary = asyncio.ensure_future(summarize_document(cleaned_text, outbox))
+    summaries.append(summary)
+    return detect_document_type(cleaned_text), outbox, summary
+
+
+async def run_pipeline(file_paths):
+    # Set when the response ends early so extraction threads stop
+    # between page windows instead of OCR-ing files nobody will read
+    stop = threading.Event()
+    summaries = []
+    documents = []
+    for file_path in file_paths:
+        log.info("⚙️ Processing file: %s", os.path.basename(file_path))
+        documents.append(asyncio.ensure_future(extract_document(file_path, stop, summaries)))
+
+    try:
+        for document in documents:
+            doc_name, outbox, summary = await document
+            yield doc_name, _drain(outbox)
+            # Surface a failed summary right after its own file's output
+            await summary
+    finally:
+        stop.set()
+        for task in documents + summaries:
+            task.cancel()
+
+
+def _sse(payload, event=None):
+    # Each line of the payload becomes a data field of one event
+    header = f"event: {event}\n" if event else ""
+    return header + "".join(f"data: {line}\n" for line in payload.split("\n")) + "\n"
 
-    return combined_output, 200, {"Content-Type": "text/html; charset=utf-8"}
+
+# -------------------------
+# MAIN API ROUTE
+# -------------------------
+@app.route("/api/testing", methods=["POST"])
+@require_api_key
+async def process_documents():
+    log.info("📩 Received document processing request...")
+
+    uploads = await request.files
+    if "file" not in uploads:
+        return jsonify({"error": "No file uploaded!"}), 400
+
+    files = uploads.getlist("file")
+    filenames = []
+    file_paths = []
+
+    work_dir = tempfile.TemporaryDirectory(prefix="medical_extractor_")
+    try:
+        for index, file in enumerate(files):
+            filename = secure_filename(file.filename)
+            # Prefix with the position so same-named uploads don't collide
+            file_path = os.path.join(work_dir.name, f"{index}_{filename}")
+            await file.save(file_path)
+            filenames.append(filename)
+            file_paths.append(file_path)
+    except BaseException:
+        work_dir.cleanup()
+        raise
+
+    async def stream_results():
+        # The uploads are removed once the stream ends or the client leaves
+        with work_dir:
+            pipeline = run_pipeline(file_paths)
+            try:
+                index = 0
+                async for doc_name, fragments in pipeline:
+                    if index:
+                        yield _sse("=========================")
+                    yield _sse(f"📄 {filenames[index]} ({doc_name})")
+                    async for fragment in fragments:
+                        yield _sse(fragment)
+                    index += 1
+                log.info("✅ All files processed successfully.")
+            except Exception as e:
+                log.exception("❌ Document processing failed: %s", e)
+                yield _sse("⚠️ Processing failed; the results above are incomplete.", event="error")
+            finally:
+                # Cancel outstanding work before the uploads are deleted
+                await pipeline.aclose()
+
+    return stream_results(), 200, {
+        "Content-Type": "text/event-stream; charset=utf-8",
+        "Cache-Control": "no-cache",
+    }
 
 
 # -------------------------
 # RUN SERVER
 # -------------------------
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    app.run(host="0.0.0.0", port=5000)